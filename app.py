@@ -1,180 +1,301 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import bottleneck as bn
+import matplotlib
+matplotlib.use("Agg") # 明確使用 Agg 後端 (只輸出 PNG，不需 GUI)
+from matplotlib.figure import Figure
 import matplotlib.font_manager as fm
+import plotly.graph_objects as go
+from tsdownsample import MinMaxLTTBDownsampler
 import yfinance as yf
 import os
+import io
+import hashlib
+from datetime import date
 
 # ==========================================
 # 1. 網頁與字型設定 (本地讀取版)
 # ==========================================
 st.set_page_config(page_title="台灣權值股分析", layout="wide")
 
-# 設定中文字型
-font_path = "TaipeiSansTCBeta-Regular.ttf"
-my_font = None
+# 全域設定
+TICKERS = {
+    "2330.TW": "台積電", "2317.TW": "鴻海", "2454.TW": "聯發科",
+    "2308.TW": "台達電", "2382.TW": "廣達", "2881.TW": "富邦金",
+    "2882.TW": "國泰金", "2412.TW": "中華電", "2303.TW": "聯電",
+    "2891.TW": "中信金"
+}
+START_DATE = "2023-01-01"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
 
-if os.path.exists(font_path):
-    my_font = fm.FontProperties(fname=font_path)
-    # 設定全域字型 (備用)
-    plt.rcParams['font.family'] = my_font.get_name()
+# 設定中文字型 (字型檔隨專案附上，以程式所在目錄定位，不依賴工作目錄)
+# 優先使用 subset_font.py 產生的精簡字型，沒有才讀完整字型
+font_path = os.path.join(BASE_DIR, "TaipeiSansTCBeta-Subset.ttf")
+if not os.path.exists(font_path):
+    font_path = os.path.join(BASE_DIR, "TaipeiSansTCBeta-Regular.ttf")
+
+@st.cache_resource(show_spinner=False)
+def get_chinese_font():
+    """註冊字型並建立 FontProperties (每個行程只做一次)"""
+    if not os.path.exists(font_path):
+        return None
+    # 註冊後設為全域字型，之後每個文字元件都走 matplotlib 的字型快取
+    fm.fontManager.addfont(font_path)
+    return fm.FontProperties(fname=font_path)
+
+my_font = get_chinese_font()
+
+if my_font:
+    matplotlib.rcParams.update({"font.family": my_font.get_name(), "axes.titlesize": 15})
 else:
     st.warning("⚠️ 找不到字型檔！請確認 GitHub 上有 TaipeiSansTCBeta-Regular.ttf")
 
 # ==========================================
 # 2. 資料載入
 # ==========================================
-@st.cache_data
+@st.cache_data(show_spinner=False, ttl=60*60*12)
 def load_data():
-    tickers = {
-        "2330.TW": "台積電", "2317.TW": "鴻海", "2454.TW": "聯發科",
-        "2308.TW": "台達電", "2382.TW": "廣達", "2881.TW": "富邦金",
-        "2882.TW": "國泰金", "2412.TW": "中華電", "2303.TW": "聯電",
-        "2891.TW": "中信金"
-    }
-    
+    # 當日磁碟快取 (容器重啟後不必重新下載)，股票清單或起始日變動時換檔
+    key = hashlib.md5(f"{','.join(TICKERS)}|{START_DATE}".encode()).hexdigest()[:8]
+    cache_path = os.path.join(CACHE_DIR, f"prices_{key}_{date.today().isoformat()}.parquet")
+
     try:
-        data = yf.download(list(tickers.keys()), start="2023-01-01", auto_adjust=False)['Adj Close']
-        if data.empty: raise ValueError("No data")
-        data.rename(columns=tickers, inplace=True)
+        if os.path.exists(cache_path):
+            data = pd.read_parquet(cache_path, engine="pyarrow")
+        else:
+            data = yf.download(list(TICKERS.keys()), start=START_DATE, auto_adjust=False, progress=False)['Adj Close']
+            if data.empty: raise ValueError("No data")
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                data.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+                # 刪掉舊日期或舊設定的快取檔，只保留這一份
+                for name in os.listdir(CACHE_DIR):
+                    if name.startswith("prices_") and name != os.path.basename(cache_path):
+                        os.remove(os.path.join(CACHE_DIR, name))
+            except OSError: pass
+        data.rename(columns=TICKERS, inplace=True)
+        data = data.astype(np.float32) # 股價約 6 位有效數字，float32 已足夠且記憶體減半
     except:
-        return None, None, None, None
+        return None, None, None, None, None
 
-    # 1. 原始資料
-    df_orig = data.copy()
+    # 1. 原始資料 (畫面只需要缺失筆數，不必另存一份副本)
+    miss_orig = missing_counts(data)[0]
     
     # 2. 模擬髒資料
-    df_dirty = data.copy()
+    # 直接寫入 NumPy 陣列，不走 pandas iloc 設值流程
+    arr = data.to_numpy(copy=True)
     try:
-        df_dirty.iloc[0:5, 0] = np.nan # 第一支股票缺5筆
-        df_dirty.iloc[10:13, 1] = np.nan # 第二支股票缺3筆
-        df_dirty.iloc[20, 2] = np.nan # 第三支股票缺1筆
+        arr[0:5, 0] = np.nan # 第一支股票缺5筆
+        arr[10:13, 1] = np.nan # 第二支股票缺3筆
+        arr[20, 2] = np.nan # 第三支股票缺1筆
     except: pass
+    df_dirty = pd.DataFrame(arr, index=data.index, columns=data.columns)
         
     # 3. 修復後資料
-    df_clean = df_dirty.ffill().bfill()
+    # 向前填補直接在 NumPy 陣列上以 C 迴圈完成 (回傳新陣列，df_dirty 不受影響)
+    arr = bn.push(arr, axis=0)
+    # 之後只剩各欄開頭的缺值，就地補上第一筆有效值，不必整張表再反向填一次
+    first = np.argmax(~np.isnan(arr), axis=0)
+    head = np.arange(len(arr))[:, None] < first
+    np.copyto(arr, arr[first, np.arange(arr.shape[1])], where=head)
+    df_clean = pd.DataFrame(arr, index=df_dirty.index, columns=df_dirty.columns)
+
+    # 4. 區間總報酬與歸一化走勢 (載入時算好，畫面重跑時不再計算)
+    # 直接用填補後的陣列廣播相除，不經 pandas 欄位對齊
+    total_return = pd.Series((arr[-1] / arr[0] - 1) * 100, index=df_clean.columns)
+    df_norm = pd.DataFrame(arr / arr[0], index=df_clean.index, columns=df_clean.columns)
     
-    return tickers, df_orig, df_dirty, df_clean
+    return miss_orig, df_dirty, df_clean, total_return, df_norm
+
+@st.cache_data
+def compute_summary(df_final):
+    """計算風險報酬表與統計摘要 (只依賴 df_final，可快取)"""
+    returns = df_final.pct_change()
+    summary_df = pd.DataFrame({
+        '平均報酬率(年)': returns.mean() * 252,
+        '風險波動率(年)': returns.std() * np.sqrt(252)
+    })
+    # 統計摘要直接對 NumPy 陣列計算 (欄位順序同 describe())
+    arr = df_final.to_numpy()
+    q25, q50, q75 = np.quantile(arr, [0.25, 0.5, 0.75], axis=0)
+    describe_df = pd.DataFrame(
+        np.stack([np.full(arr.shape[1], arr.shape[0]), arr.mean(0), arr.std(0, ddof=1), arr.min(0), q25, q50, q75, arr.max(0)]),
+        index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"], columns=df_final.columns,
+    )
+    # 日報酬率只是中間值，不回傳 (快取每次命中都要複製回傳值)
+    return summary_df, describe_df
+
+@st.cache_data
+def missing_counts(*dfs):
+    """各表每欄缺失筆數 (直接對 NumPy 陣列做 isnan)"""
+    return [pd.DataFrame(np.isnan(d.to_numpy()).sum(axis=0, keepdims=True), columns=d.columns, index=["缺失數"]) for d in dfs]
+
+@st.cache_data
+def style_summary(summary_df):
+    """風險報酬表轉成帶漸層底色的 HTML (Styler 逐格產生 CSS 很慢，只做一次)"""
+    return summary_df.style.format("{:.4f}").background_gradient(cmap="Blues").to_html()
+
+PLOT_POINTS = 1000 # 圖寬約 1000 px，多的點畫不出來
+
+def downsample_idx(x, values, n_out=PLOT_POINTS):
+    """以 MinMaxLTTB 挑出要畫的點位，繪圖成本隨像素而非資料筆數成長"""
+    if len(values) <= n_out:
+        return np.arange(len(values))
+    return MinMaxLTTBDownsampler().downsample(x, np.ascontiguousarray(values), n_out=n_out)
+
+# ==========================================
+# 3. 繪圖 (依輸入快取，切換分頁或無關的重跑不必重畫)
+# ==========================================
+# 圖表快取上限：走勢圖每檔股票一張 + 全部比較，並隨資料一起過期
+FIG_CACHE_ENTRIES = len(TICKERS) + 1
+FIG_CACHE_TTL = 60*60*12
+
+def fig_to_png(fig):
+    """matplotlib 圖表輸出成 PNG bytes (快取 bytes 而非 Figure，多個工作階段不會共用同一張圖)"""
+    buf = io.BytesIO()
+    # 以 72 dpi 輸出 (st.pyplot 預設 200 dpi)，PNG 約小三倍；畫面上以原尺寸顯示，不放大避免模糊
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=72)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=1, ttl=FIG_CACHE_TTL)
+def make_risk_png(summary_df):
+    # 直接建 Figure 不經 pyplot，圖表不會留在 pyplot 的全域清單裡
+    fig_risk = Figure(figsize=(10, 6))
+    ax_risk = fig_risk.subplots()
+    
+    x = summary_df['風險波動率(年)'].to_numpy()
+    y = summary_df['平均報酬率(年)'].to_numpy()
+    
+    ax_risk.scatter(x, y, color='red', s=100, alpha=0.7)
+    
+    # 標示文字 (字型已設為全域，迴圈內只放文字)
+    for xi, yi, txt in zip(x + 0.002, y, summary_df.index):
+        ax_risk.text(xi, yi, txt, fontsize=12)
+    
+    # 設定標籤字型
+    if my_font:
+        ax_risk.set_xlabel("風險 (波動率)")
+        ax_risk.set_ylabel("年化報酬率")
+        ax_risk.set_title("風險 vs 報酬 (越左上越好)")
+    
+    ax_risk.grid(True, alpha=0.3)
+    return fig_to_png(fig_risk)
+
+@st.cache_resource(show_spinner=False, max_entries=FIG_CACHE_ENTRIES, ttl=FIG_CACHE_TTL)
+def make_trend_fig(selected_stock, x_ms, df_final, df_norm):
+    # 改用 Plotly：只傳 JSON 給瀏覽器以 WebGL 繪製，中文字由瀏覽器字型處理
+    # 先備好所有線條再一次建圖，避免逐條 add_trace 重複驗證整張圖
+    traces = []
+    
+    if selected_stock == "全部比較 (歸一化)":
+        for col in df_norm.columns:
+            y = df_norm[col].values
+            idx = downsample_idx(x_ms, y)
+            traces.append(go.Scattergl(x=x_ms[idx], y=y[idx], name=col, opacity=0.8))
+        ylabel_text = "倍數"
+    else:
+        y = df_final[selected_stock].values
+        idx = downsample_idx(x_ms, y)
+        x = x_ms[idx]
+        traces.append(go.Scattergl(x=x, y=y[idx], name=selected_stock, line=dict(color='blue')))
+        # 加均線 (與股價共用同一組取樣點)
+        ma20 = bn.move_mean(df_final[selected_stock].values, window=20)
+        traces.append(go.Scattergl(x=x, y=ma20[idx], name='月線 (20MA)', line=dict(color='orange', dash='dash')))
+        ylabel_text = "價格"
+
+    fig = go.Figure(data=traces)
+
+    fig.update_layout(title=f"{selected_stock} 走勢圖", yaxis_title=ylabel_text, xaxis_type="date", height=500)
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=1, ttl=FIG_CACHE_TTL)
+def make_rank_png(total_return):
+    ret = total_return.sort_values(ascending=False)
+    
+    fig2 = Figure(figsize=(10, 6))
+    ax2 = fig2.subplots()
+    colors = np.where(ret.values > 0, 'red', 'green')
+    ax2.bar(range(len(ret)), ret.values, color=colors, tick_label=ret.index)
+    ax2.tick_params(axis='x', labelsize=12)
+    
+    if my_font:
+        ax2.set_title("近一年報酬率排行 (%)")
+        ax2.set_ylabel("報酬率 %")
+    return fig_to_png(fig2)
+
+# 先畫出標題，下載期間頁面不會是一片空白
+st.title("📈 台灣前十大權值股分析系統")
 
 # 執行載入
-tickers_map, df_orig, df_dirty, df_final = load_data()
+with st.spinner("⏳ 正在下載股價資料..."):
+    miss_orig, df_dirty, df_final, total_return, df_norm = load_data()
 
 if df_final is None:
     st.error("❌ 資料下載失敗，請重新整理網頁。")
     st.stop()
 
+# 日期先轉成毫秒數值 (只轉一次)，Plotly 不必逐點把日期序列化成字串
+x_ms = df_final.index.to_numpy().astype("datetime64[ms]").astype("int64")
+
 # ==========================================
-# 3. 介面顯示 - 第一部分：資料清洗
+# 4. 介面顯示 - 第一部分：資料清洗
 # ==========================================
-st.title("📈 台灣前十大權值股分析系統")
-
 st.header("1. 資料清洗演示 (Data Cleaning)")
+miss_dirty, miss_final = missing_counts(df_dirty, df_final)
 c1, c2, c3 = st.columns(3)
 with c1:
     st.info("步驟 1：原始資料")
-    st.dataframe(df_orig.isnull().sum().to_frame("缺失數").T)
+    st.table(miss_orig)
 with c2:
     st.warning("步驟 2：模擬缺失 (紅色)")
-    st.dataframe(df_dirty.isnull().sum().to_frame("缺失數").T.style.highlight_max(axis=1, color='pink'))
+    st.table(miss_dirty.style.highlight_max(axis=1, color='pink'))
 with c3:
     st.success("步驟 3：修復完成")
-    st.dataframe(df_final.isnull().sum().to_frame("缺失數").T)
+    st.table(miss_final)
 
 st.markdown("---")
 
 # ==========================================
-# 4. 介面顯示 - 第二部分：統計與風險 (這部分是加回來的！)
+# 5. 介面顯示 - 第二部分：統計與風險 (這部分是加回來的！)
 # ==========================================
 st.header("2. 統計數據與風險分析")
 
 # 計算指標
-returns = df_final.pct_change()
-summary_df = pd.DataFrame({
-    '平均報酬率(年)': returns.mean() * 252,
-    '風險波動率(年)': returns.std() * np.sqrt(252)
-})
+summary_df, describe_df = compute_summary(df_final)
 
 col_stats_1, col_stats_2 = st.columns([1, 1.5]) # 左窄右寬
 
 with col_stats_1:
     st.subheader("📊 股價統計摘要")
-    st.dataframe(df_final.describe())
+    st.dataframe(describe_df)
     st.subheader("⚖️ 風險報酬數值")
-    st.dataframe(summary_df.style.format("{:.4f}").background_gradient(cmap="Blues"))
+    st.html(style_summary(summary_df))
 
 with col_stats_2:
     st.subheader("風險 vs 報酬 散佈圖")
-    fig_risk, ax_risk = plt.subplots(figsize=(10, 6))
-    
-    x = summary_df['風險波動率(年)']
-    y = summary_df['平均報酬率(年)']
-    
-    ax_risk.scatter(x, y, color='red', s=100, alpha=0.7)
-    
-    # 標示文字
-    for i, txt in enumerate(summary_df.index):
-        label_font = my_font if my_font else None
-        ax_risk.text(x.iloc[i]+0.002, y.iloc[i], txt, fontproperties=label_font, fontsize=12)
-    
-    # 設定標籤字型
-    if my_font:
-        ax_risk.set_xlabel("風險 (波動率)", fontproperties=my_font)
-        ax_risk.set_ylabel("年化報酬率", fontproperties=my_font)
-        ax_risk.set_title("風險 vs 報酬 (越左上越好)", fontproperties=my_font, fontsize=15)
-    
-    ax_risk.grid(True, alpha=0.3)
-    st.pyplot(fig_risk)
+    st.image(make_risk_png(summary_df), width="content")
 
 st.markdown("---")
 
 # ==========================================
-# 5. 介面顯示 - 第三部分：互動儀表板
+# 6. 介面顯示 - 第三部分：互動儀表板
 # ==========================================
 st.header("3. 視覺化儀表板 (Dashboard)")
 tab1, tab2 = st.tabs(["📈 股價走勢", "🏆 報酬率排行"])
 
-with tab1:
+# 選股只重跑這個 fragment，不會連帶重跑整頁的表格與其他圖表
+@st.fragment
+def trend_tab():
     st.subheader("股價走勢")
-    selected_stock = st.selectbox("選擇股票:", ["全部比較 (歸一化)"] + list(tickers_map.values()))
-    
-    fig, ax = plt.subplots(figsize=(10, 5))
+    selected_stock = st.selectbox("選擇股票:", ["全部比較 (歸一化)"] + list(TICKERS.values()))
     
-    if selected_stock == "全部比較 (歸一化)":
-        for col in df_final.columns:
-            ax.plot(df_final[col] / df_final[col].iloc[0], label=col, alpha=0.8)
-        ylabel_text = "倍數"
-    else:
-        ax.plot(df_final[selected_stock], label=selected_stock, color='blue')
-        # 加均線
-        ma20 = df_final[selected_stock].rolling(20).mean()
-        ax.plot(ma20, label='月線 (20MA)', color='orange', linestyle='--')
-        ylabel_text = "價格"
+    st.plotly_chart(make_trend_fig(selected_stock, x_ms, df_final, df_norm))
 
-    if my_font:
-        ax.set_title(f"{selected_stock} 走勢圖", fontproperties=my_font, fontsize=15)
-        ax.set_ylabel(ylabel_text, fontproperties=my_font)
-        ax.legend(prop=my_font)
-        for label in ax.get_xticklabels() + ax.get_yticklabels():
-            label.set_fontproperties(my_font)
-    else:
-        ax.legend()
-        
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+with tab1:
+    trend_tab()
 
 with tab2:
     st.subheader("報酬率排行")
-    ret = (df_final.iloc[-1] / df_final.iloc[0] - 1) * 100
-    ret = ret.sort_values(ascending=False)
-    
-    fig2, ax2 = plt.subplots(figsize=(10, 6))
-    colors = ['red' if v > 0 else 'green' for v in ret.values]
-    ax2.bar(ret.index, ret.values, color=colors)
-    
-    if my_font:
-        ax2.set_title("近一年報酬率排行 (%)", fontproperties=my_font, fontsize=15)
-        ax2.set_xticklabels(ret.index, fontproperties=my_font, fontsize=12)
-        ax2.set_ylabel("報酬率 %", fontproperties=my_font)
-        
-    st.pyplot(fig2)
+    st.image(make_rank_png(total_return), width="content")
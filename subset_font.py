@@ -0,0 +1,59 @@
+"""
+產生精簡版中文字型 (建置時執行，修改 app.py 的中文字串後需重跑)
+
+    pip install fonttools   # 只在建置時需要，不列入 requirements.txt
+    python subset_font.py
+
+從 app.py 的字串常值 (不含註解與 docstring) 擷取非 ASCII 字元，加上完整 ASCII 與數學負號，
+把 TaipeiSansTCBeta-Regular.ttf (約 20 MB) 裁成只含這些字形的 TTF。
+matplotlib 的 FreeType 讀不了 woff2，所以輸出維持 TTF 格式。
+"""
+import ast
+import os
+
+from fontTools import subset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_FONT = os.path.join(BASE_DIR, "TaipeiSansTCBeta-Regular.ttf")
+OUT_FONT = os.path.join(BASE_DIR, "TaipeiSansTCBeta-Subset.ttf")
+APP_FILE = os.path.join(BASE_DIR, "app.py")
+
+
+def collect_text():
+    """收集介面會用到的字元：app.py 字串常值裡的非 ASCII 字元 + ASCII + U+2212 (負號)"""
+    with open(APP_FILE, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    # docstring 不會畫到圖上，排除以免改說明就得重產字型
+    docstrings = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.body:
+            first = node.body[0]
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant):
+                docstrings.add(id(first.value))
+
+    chars = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in docstrings:
+            chars.update(c for c in node.value if ord(c) > 0x7f)
+    chars.update(chr(c) for c in range(0x20, 0x7f))
+    chars.add("−")
+    return "".join(sorted(chars))
+
+
+def main():
+    options = subset.Options()
+    options.name_IDs = ["*"] # 保留字型名稱，matplotlib 以名稱找字型
+    options.layout_features = ["*"]
+    options.notdef_outline = True
+
+    font = subset.load_font(SRC_FONT, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=collect_text())
+    subsetter.subset(font)
+    subset.save_font(font, OUT_FONT, options)
+    print(f"{OUT_FONT}: {os.path.getsize(OUT_FONT) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()